@@ -32,6 +32,9 @@ class IndexHashOp : public Operator<Context> {
         seed_(OperatorBase::GetSingleArgument<int64_t>("seed", 0)),
         modulo_(OperatorBase::GetSingleArgument<int64_t>("modulo", 0)) {
     CAFFE_ENFORCE_GT(modulo_, 0, "MODULO should be > 0");
+    // For a power of two modulo, the non-negative remainder is a bit mask
+    // of the two's complement value, which avoids two integer divisions.
+    modulo_mask_ = (modulo_ & (modulo_ - 1)) == 0 ? modulo_ - 1 : -1;
   }
 
   bool RunOnDevice() override {
@@ -69,6 +72,9 @@ class IndexHashOp : public Operator<Context> {
     for (int i = 0; i < sizeof(T) / sizeof(int8_t); i++) {
       hashed = hashed * 65537 + bytes[i];
     }
+    if (modulo_mask_ >= 0) {
+      return static_cast<T>(hashed & modulo_mask_);
+    }
     hashed = static_cast<T>((modulo_ + hashed % modulo_) % modulo_);
     return hashed;
   }
@@ -79,6 +85,7 @@ class IndexHashOp : public Operator<Context> {
 
   int64_t seed_;
   int64_t modulo_;
+  int64_t modulo_mask_;
 };
 
 } // namespace caffe2
@@ -18,7 +18,6 @@
 #!/usr/bin/env python2
 
 import argparse
-import copy
 import logging
 import re
 import numpy as np  # noqa
@@ -41,12 +40,15 @@ def _StateMeetsRule(state, rule):
         return False
     if rule.HasField('max_level') and state.level > rule.max_level:
         return False
-    curr_stages = set(list(state.stage))
+    if not rule.stage and not rule.not_stage:
+        # No stage constraints, so there is no need to collect the stages.
+        return True
+    curr_stages = frozenset(state.stage)
     # all stages in rule.stages should be in, otherwise it's not a match.
-    if len(rule.stage) and any([s not in curr_stages for s in rule.stage]):
+    if len(rule.stage) and any(s not in curr_stages for s in rule.stage):
         return False
     # none of the stage in rule.stages should be in, otherwise it's not a match.
-    if len(rule.not_stage) and any([s in curr_stages for s in rule.not_stage]):
+    if len(rule.not_stage) and any(s in curr_stages for s in rule.not_stage):
         return False
     # If none of the nonmatch happens, return True.
     return True
@@ -54,13 +56,14 @@ def _StateMeetsRule(state, rule):
 
 def _ShouldInclude(net_state, layer):
     """A function that reproduces Caffe's inclusion and exclusion rule."""
-    ret = (len(layer.include) == 0)
-    # check exclude rules: if any exclusion is met, we shouldn't include.
-    ret &= not any([_StateMeetsRule(net_state, rule) for rule in layer.exclude])
     if len(layer.include):
         # check include rules: if any inclusion is met, we should include.
-        ret |= any([_StateMeetsRule(net_state, rule) for rule in layer.include])
-    return ret
+        return any(_StateMeetsRule(net_state, rule) for rule in layer.include)
+    if not len(layer.exclude):
+        # The common case: no rules at all.
+        return True
+    # check exclude rules: if any exclusion is met, we shouldn't include.
+    return not any(_StateMeetsRule(net_state, rule) for rule in layer.exclude)
 
 
 def _GetLegacyDims(net, net_params, dummy_input, legacy_pad_ops):
@@ -216,24 +219,29 @@ class TranslatorRegistry(object):
         """A decorator for registering gradient mappings."""
 
         def Wrapper(func):
-            cls.registry_[op_name] = func
+            def Translate(layer, pretrained_blobs, is_test, **kwargs):
+                # Translators may return None or a single op; normalize to a
+                # list here so TranslateLayer does not need to check.
+                caffe_ops, params = func(
+                    layer, pretrained_blobs, is_test, **kwargs)
+                if caffe_ops is None:
+                    caffe_ops = []
+                elif type(caffe_ops) is not list:
+                    caffe_ops = [caffe_ops]
+                return caffe_ops, params
+
+            cls.registry_[op_name] = Translate
             return func
 
         return Wrapper
 
     @classmethod
     def TranslateLayer(cls, layer, pretrained_blobs, is_test, **kwargs):
-        try:
-            caffe_ops, params = cls.registry_[layer.type](
-                layer, pretrained_blobs, is_test, **kwargs)
-        except KeyError:
+        translate = cls.registry_.get(layer.type)
+        if translate is None:
             raise KeyError('No translator registered for layer: %s yet.' %
                            str(layer))
-        if caffe_ops is None:
-            caffe_ops = []
-        if type(caffe_ops) is not list:
-            caffe_ops = [caffe_ops]
-        return caffe_ops, params
+        return translate(layer, pretrained_blobs, is_test, **kwargs)
 
     @classmethod
     def TranslateModel(
@@ -257,33 +265,39 @@ class TranslatorRegistry(object):
             )
         if not input_dims:
             input_dims = _GetInputDims(caffe_net)
+        # Index the pretrained blobs by layer name once, instead of scanning
+        # both layer lists for every layer we translate. The blobs are only
+        # converted to numpy for layers that are actually translated.
+        pretrained_blobs_by_name = {}
+        duplicated_names = set()
+        for pretrained_layers in (pretrained_net.layer, pretrained_net.layers):
+            for l in pretrained_layers:
+                if l.name in pretrained_blobs_by_name:
+                    duplicated_names.add(l.name)
+                pretrained_blobs_by_name[l.name] = l.blobs
+        translate_layer = cls.TranslateLayer
+        log_info = log.info
+        # Layers have to be translated in order, and each layer's ops and
+        # params have to be added to net and net_params before the next one
+        # is translated: translators such as Crop run the partially built net
+        # and net_params to infer blob shapes.
         for layer in caffe_net.layer:
             if not _ShouldInclude(net_state, layer):
-                log.info('Current net state does not need layer {}'
-                            .format(layer.name))
+                log_info('Current net state does not need layer %s',
+                         layer.name)
                 continue
-            log.info('Translate layer {}'.format(layer.name))
+            log_info('Translate layer %s', layer.name)
             # Get pretrained one
-            pretrained_layers = (
-                [l for l in pretrained_net.layer
-                 if l.name == layer.name] + [l
-                                             for l in pretrained_net.layers
-                                             if l.name == layer.name]
-            )
-            if len(pretrained_layers) > 1:
+            if layer.name in duplicated_names:
                 raise ValueError(
                     'huh? more than one pretrained layer of one name?')
-            elif len(pretrained_layers) == 1:
-                pretrained_blobs = [
-                    utils.CaffeBlobToNumpyArray(blob)
-                    for blob in pretrained_layers[0].blobs
-                ]
-            else:
-                # No pretrained layer for the given layer name. We'll just pass
-                # no parameter blobs.
-                # print 'No pretrained layer for layer', layer.name
-                pretrained_blobs = []
-            operators, params = cls.TranslateLayer(
+            # If there is no pretrained layer for the given layer name, we'll
+            # just pass no parameter blobs.
+            pretrained_blobs = [
+                utils.CaffeBlobToNumpyArray(blob)
+                for blob in pretrained_blobs_by_name.get(layer.name, ())
+            ]
+            operators, params = translate_layer(
                 layer, pretrained_blobs, is_test, net=net,
                 net_params=net_params, input_dims=input_dims)
             net.op.extend(operators)
@@ -299,25 +313,49 @@ def TranslateModel(*args, **kwargs):
     return TranslatorRegistry.TranslateModel(*args, **kwargs)
 
 
+# Maps a TensorProto data type to the fill op that can recreate it, the
+# TensorProto field holding its data and the Argument field to copy it into.
+# Double tensors are left out: Argument only has a 32-bit floats field, so
+# their values could not reach GivenTensorDoubleFill at full precision.
+_GIVEN_TENSOR_FILLS = {
+    caffe2_pb2.TensorProto.FLOAT: ("GivenTensorFill", "float_data", "floats"),
+    caffe2_pb2.TensorProto.INT32:
+        ("GivenTensorIntFill", "int32_data", "ints"),
+    caffe2_pb2.TensorProto.INT64:
+        ("GivenTensorInt64Fill", "int64_data", "ints"),
+}
+
+
 def ConvertTensorProtosToInitNet(net_params, input_name):
     """Takes the net_params returned from TranslateModel, and wrap it as an
     init net that contain GivenTensorFill.
 
-    This is a very simple feature that only works with float tensors, and is
-    only intended to be used in an environment where you want a single
-    initialization file - for more complex cases, use a db to store the
-    parameters.
+    This is a very simple feature that only works with float, int32 and int64
+    tensors, and is only intended to be used in an environment where you want
+    a single initialization file - for more complex cases, use a db to store
+    the parameters.
     """
     init_net = caffe2_pb2.NetDef()
     for tensor in net_params.protos:
-        if len(tensor.float_data) == 0:
+        if tensor.data_type not in _GIVEN_TENSOR_FILLS:
+            raise RuntimeError(
+                "Only float, int32 and int64 tensors are supported in this "
+                "util.")
+        op_type, data_field, arg_field = _GIVEN_TENSOR_FILLS[tensor.data_type]
+        data = getattr(tensor, data_field)
+        if len(data) == 0:
             raise RuntimeError(
-                "Only float tensors are supported in this util.")
+                "Tensor {} has no {}.".format(tensor.name, data_field))
+        # Copy the repeated field over in one go rather than letting
+        # MakeArgument inspect the values one element at a time.
+        values = caffe2_pb2.Argument()
+        values.name = "values"
+        getattr(values, arg_field).extend(data)
         op = core.CreateOperator(
-            "GivenTensorFill", [], [tensor.name],
+            op_type, [], [tensor.name],
             arg=[
                 utils.MakeArgument("shape", list(tensor.dims)),
-                utils.MakeArgument("values", tensor.float_data)])
+                values])
         init_net.op.extend([op])
     init_net.op.extend([core.CreateOperator("ConstantFill", [], [input_name], shape=[1])])
     return init_net
@@ -325,17 +363,19 @@ def ConvertTensorProtosToInitNet(net_params, input_name):
 
 def BaseTranslate(layer, caffe2_type):
     """A simple translate interface that maps the layer input and output."""
-    caffe2_op = caffe2_pb2.OperatorDef()
-    caffe2_op.type = caffe2_type
-    caffe2_op.input.extend(layer.bottom)
-    caffe2_op.output.extend(layer.top)
-    return caffe2_op
+    return caffe2_pb2.OperatorDef(
+        type=caffe2_type, input=layer.bottom, output=layer.top)
 
 
 def AddArgument(op, key, value):
     """Makes an argument based on the value type."""
     op.arg.extend([utils.MakeArgument(key, value)])
 
+
+def AddArguments(op, items):
+    """Makes arguments from (key, value) pairs and adds them in one extend."""
+    op.arg.extend([utils.MakeArgument(key, value) for key, value in items])
+
 ################################################################################
 # Common translators for layers.
 ################################################################################
@@ -375,29 +415,36 @@ def _TranslateStridePadKernelHelper(param, caffe_op):
         stride = param.stride
         pad = param.pad
         kernel = param.kernel_size
+    has_stride_hw = param.HasField("stride_h") or param.HasField("stride_w")
+    has_pad_hw = param.HasField("pad_h") or param.HasField("pad_w")
+    has_kernel_hw = param.HasField("kernel_h") or param.HasField("kernel_w")
+    args = []
     # Get stride
-    if param.HasField("stride_h") or param.HasField("stride_w"):
-        AddArgument(caffe_op, "stride_h", param.stride_h)
-        AddArgument(caffe_op, "stride_w", param.stride_w)
+    if has_stride_hw:
+        args.append(("stride_h", param.stride_h))
+        args.append(("stride_w", param.stride_w))
     else:
-        AddArgument(caffe_op, "stride", stride)
+        args.append(("stride", stride))
     # Get pad
-    if param.HasField("pad_h") or param.HasField("pad_w"):
-        if param.pad_h == param.pad_w:
-            AddArgument(caffe_op, "pad", param.pad_h)
+    if has_pad_hw:
+        pad_h = param.pad_h
+        pad_w = param.pad_w
+        if pad_h == pad_w:
+            args.append(("pad", pad_h))
         else:
-            AddArgument(caffe_op, "pad_t", param.pad_h)
-            AddArgument(caffe_op, "pad_b", param.pad_h)
-            AddArgument(caffe_op, "pad_l", param.pad_w)
-            AddArgument(caffe_op, "pad_r", param.pad_w)
+            args.append(("pad_t", pad_h))
+            args.append(("pad_b", pad_h))
+            args.append(("pad_l", pad_w))
+            args.append(("pad_r", pad_w))
     else:
-        AddArgument(caffe_op, "pad", pad)
+        args.append(("pad", pad))
     # Get kernel
-    if param.HasField("kernel_h") or param.HasField("kernel_w"):
-        AddArgument(caffe_op, "kernel_h", param.kernel_h)
-        AddArgument(caffe_op, "kernel_w", param.kernel_w)
+    if has_kernel_hw:
+        args.append(("kernel_h", param.kernel_h))
+        args.append(("kernel_w", param.kernel_w))
     else:
-        AddArgument(caffe_op, "kernel", kernel)
+        args.append(("kernel", kernel))
+    AddArguments(caffe_op, args)
 
 
 @TranslatorRegistry.Register("Convolution3D")
@@ -407,21 +454,17 @@ def TranslateConvNd(layer, pretrained_blobs, is_test, **kwargs):
     output = caffe_op.output[0]
     caffe_op.input.append(output + '_w')
 
-    AddArgument(
-        caffe_op,
-        "kernels",
-        [param.kernel_depth, param.kernel_size, param.kernel_size])
-    AddArgument(
-        caffe_op,
-        "strides",
-        [param.temporal_stride, param.stride, param.stride])
     temporal_pad = 0
     spatial_pad = 0
     if hasattr(param, 'temporal_pad'):
         temporal_pad = param.temporal_pad
     if hasattr(param, 'pad'):
         spatial_pad = param.pad
-    AddArgument(caffe_op, "pads", [temporal_pad, spatial_pad, spatial_pad] * 2)
+    AddArguments(caffe_op, [
+        ("kernels", [param.kernel_depth, param.kernel_size, param.kernel_size]),
+        ("strides", [param.temporal_stride, param.stride, param.stride]),
+        ("pads", [temporal_pad, spatial_pad, spatial_pad] * 2),
+    ])
 
     # weight
     params = [
@@ -431,7 +474,7 @@ def TranslateConvNd(layer, pretrained_blobs, is_test, **kwargs):
         caffe_op.input.append(output + '_b')
         params.append(
             utils.NumpyArrayToCaffe2Tensor(
-                pretrained_blobs[1].flatten(), output + '_b'))
+                pretrained_blobs[1].ravel(), output + '_b'))
     return caffe_op, params
 
 
@@ -450,7 +493,7 @@ def TranslateConv(layer, pretrained_blobs, is_test, **kwargs):
         caffe_op.input.append(output + '_b')
         params.append(
             utils.NumpyArrayToCaffe2Tensor(
-                pretrained_blobs[1].flatten(), output + '_b'))
+                pretrained_blobs[1].ravel(), output + '_b'))
     # Group convolution option
     if param.group != 1:
         AddArgument(caffe_op, "group", param.group)
@@ -480,7 +523,7 @@ def TranslateDeconv(layer, pretrained_blobs, is_test, **kwargs):
     weight = utils.NumpyArrayToCaffe2Tensor(pretrained_blobs[0], output + '_w')
     if param.bias_term:
         bias = utils.NumpyArrayToCaffe2Tensor(
-            pretrained_blobs[1].flatten(), output + '_b'
+            pretrained_blobs[1].ravel(), output + '_b'
         )
         caffe_op.input.extend([output + '_b'])
         return caffe_op, [weight, bias]
@@ -560,23 +603,18 @@ def TranslatePool3D(layer, pretrained_blobs, is_test, **kwargs):
 
     elif param.pool == caffe_pb2.Pooling3DParameter.AVE:
         caffe_op = BaseTranslate(layer, "AveragePool")
-    AddArgument(caffe_op, "order", "NCHW")
-    AddArgument(
-        caffe_op,
-        "kernels",
-        [param.kernel_depth, param.kernel_size, param.kernel_size])
-
-    AddArgument(
-        caffe_op,
-        "strides",
-        [param.temporal_stride, param.stride, param.stride])
     temporal_pad = 0
     spatial_pad = 0
     if hasattr(param, 'temporal_pad'):
         temporal_pad = param.temporal_pad
     if hasattr(param, 'pad'):
         spatial_pad = param.pad
-    AddArgument(caffe_op, "pads", [temporal_pad, spatial_pad, spatial_pad] * 2)
+    AddArguments(caffe_op, [
+        ("order", "NCHW"),
+        ("kernels", [param.kernel_depth, param.kernel_size, param.kernel_size]),
+        ("strides", [param.temporal_stride, param.stride, param.stride]),
+        ("pads", [temporal_pad, spatial_pad, spatial_pad] * 2),
+    ])
     return caffe_op, []
 
 
@@ -588,11 +626,13 @@ def TranslateLRN(layer, pretrained_blobs, is_test, **kwargs):
     if param.norm_region != caffe_pb2.LRNParameter.ACROSS_CHANNELS:
         raise ValueError(
             "Does not support norm region other than across channels.")
-    AddArgument(caffe_op, "size", int(param.local_size))
-    AddArgument(caffe_op, "alpha", float(param.alpha))
-    AddArgument(caffe_op, "beta", float(param.beta))
-    AddArgument(caffe_op, "bias", float(param.k))
-    AddArgument(caffe_op, "order", "NCHW")
+    AddArguments(caffe_op, [
+        ("size", int(param.local_size)),
+        ("alpha", float(param.alpha)),
+        ("beta", float(param.beta)),
+        ("bias", float(param.k)),
+        ("order", "NCHW"),
+    ])
     return caffe_op, []
 
 
@@ -627,7 +667,7 @@ def TranslateInnerProduct(layer, pretrained_blobs, is_test, **kwargs):
         output + '_w'
     )
     bias = utils.NumpyArrayToCaffe2Tensor(
-        pretrained_blobs[1].flatten(), output + '_b'
+        pretrained_blobs[1].ravel(), output + '_b'
     )
     return caffe_op, [weight, bias]
 
@@ -692,9 +732,9 @@ def TranslateInstanceNorm(layer, pretrained_blobs, is_test, **kwargs):
     caffe_op = BaseTranslate(layer, "InstanceNorm")
     output = caffe_op.output[0]
     weight = utils.NumpyArrayToCaffe2Tensor(
-        pretrained_blobs[0].flatten(), output + '_w')
+        pretrained_blobs[0].ravel(), output + '_w')
     bias = utils.NumpyArrayToCaffe2Tensor(
-        pretrained_blobs[1].flatten(), output + '_b')
+        pretrained_blobs[1].ravel(), output + '_b')
     caffe_op.input.extend([output + '_w', output + '_b'])
     AddArgument(caffe_op, "order", "NCHW")
     return caffe_op, [weight, bias]
@@ -705,9 +745,11 @@ def TranslateBatchNorm(layer, pretrained_blobs, is_test, **kwargs):
     caffe_op = BaseTranslate(layer, "SpatialBN")
     output = caffe_op.output[0]
     param = layer.batch_norm_param
-    AddArgument(caffe_op, "is_test", is_test)
-    AddArgument(caffe_op, "epsilon", param.eps)
-    AddArgument(caffe_op, "order", "NCHW")
+    AddArguments(caffe_op, [
+        ("is_test", is_test),
+        ("epsilon", param.eps),
+        ("order", "NCHW"),
+    ])
 
     caffe_op.input.extend(
         [output + "_scale",
@@ -723,21 +765,22 @@ def TranslateBatchNorm(layer, pretrained_blobs, is_test, **kwargs):
 
     n_channels = pretrained_blobs[0].shape[0]
     if pretrained_blobs[2][0] != 0:
+        inv_scale = pretrained_blobs[2].dtype.type(1. / pretrained_blobs[2][0])
         mean = utils.NumpyArrayToCaffe2Tensor(
-            (1. / pretrained_blobs[2][0]) * pretrained_blobs[0],
+            pretrained_blobs[0] * inv_scale,
             output + '_mean')
         var = utils.NumpyArrayToCaffe2Tensor(
-            (1. / pretrained_blobs[2][0]) * pretrained_blobs[1],
+            pretrained_blobs[1] * inv_scale,
             output + '_var')
     else:
         raise RuntimeError("scalar is zero.")
-    pretrained_blobs[2][0] = 1
-    pretrained_blobs[2] = np.tile(pretrained_blobs[2], (n_channels, ))
+    # The moving average factor is folded into mean and var above, so the
+    # scale is all ones and the bias all zeros.
     scale = utils.NumpyArrayToCaffe2Tensor(
-        pretrained_blobs[2],
+        np.ones(n_channels, dtype=pretrained_blobs[2].dtype),
         output + '_scale')
     bias = utils.NumpyArrayToCaffe2Tensor(
-        np.zeros_like(pretrained_blobs[2]),
+        np.zeros(n_channels, dtype=pretrained_blobs[2].dtype),
         output + '_bias')
 
     return caffe_op, [scale, bias, mean, var]
@@ -770,7 +813,7 @@ def TranslateScale(layer, pretrained_blobs, is_test, **kwargs):
         mul_op.input.append(mul_op_param)
         weights = []
         weights.append(utils.NumpyArrayToCaffe2Tensor(
-            pretrained_blobs[0].flatten(), mul_op_param))
+            pretrained_blobs[0].ravel(), mul_op_param))
 
         add_op = None
         if len(pretrained_blobs) == 1:
@@ -780,17 +823,17 @@ def TranslateScale(layer, pretrained_blobs, is_test, **kwargs):
             # Caffe Scale layer supports a bias term such that it computes
             # (scale_param * X + bias), whereas Caffe2 Mul op doesn't.
             # Include a separate Add op for the bias followed by Mul.
-            add_op = copy.deepcopy(mul_op)
-            add_op.type = "Add"
             add_op_param = output + '_b'
             internal_blob = output + "_internal"
+            add_op = caffe2_pb2.OperatorDef()
+            add_op.type = "Add"
+            add_op.input.extend([internal_blob, add_op_param])
+            add_op.output.append(output)
+            add_op.arg.extend(mul_op.arg)
             del mul_op.output[:]
             mul_op.output.append(internal_blob)
-            del add_op.input[:]
-            add_op.input.append(internal_blob)
-            add_op.input.append(add_op_param)
             weights.append(utils.NumpyArrayToCaffe2Tensor(
-                pretrained_blobs[1].flatten(), add_op_param))
+                pretrained_blobs[1].ravel(), add_op_param))
         else:
             raise RuntimeError("Unexpected number of pretrained blobs in Scale")
 
@@ -851,12 +894,11 @@ def TranslateROIPooling(layer, pretrained_blobs, is_test, **kwargs):
         caffe_op.output.append(caffe_op.output[0] + '_argmaxes')
 
     param = layer.roi_pooling_param
-    if param.HasField('pooled_h'):
-        AddArgument(caffe_op, 'pooled_h', param.pooled_h)
-    if param.HasField('pooled_w'):
-        AddArgument(caffe_op, 'pooled_w', param.pooled_w)
-    if param.HasField('spatial_scale'):
-        AddArgument(caffe_op, 'spatial_scale', param.spatial_scale)
+    AddArguments(caffe_op, [
+        (key, getattr(param, key))
+        for key in ('pooled_h', 'pooled_w', 'spatial_scale')
+        if param.HasField(key)
+    ])
 
     return caffe_op, []
 
@@ -915,17 +957,18 @@ if __name__ == '__main__':
     output_init_net = args.init_net
     output_predict_net = args.predict_net
 
-    text_format.Merge(
-        open(input_proto, 'r').read(), caffenet
-    )
-    caffenet_pretrained.ParseFromString(
-        open(input_caffemodel, 'rb').read()
-    )
+    with open(input_proto, 'r') as f:
+        text_format.Merge(f.read(), caffenet)
+    with open(input_caffemodel, 'rb') as f:
+        caffenet_pretrained.ParseFromString(f.read())
     net, pretrained_params = TranslateModel(
         caffenet, caffenet_pretrained, is_test=True,
         remove_legacy_pad=args.remove_legacy_pad,
         input_dims=args.input_dims
     )
+    # The weights now live in pretrained_params; drop the caffe copy so it is
+    # not kept alive while the init net is built and serialized.
+    del caffenet_pretrained
 
     # Assume there is one input and one output
     external_input = net.op[0].input[0]
@@ -935,6 +978,7 @@ if __name__ == '__main__':
     net.external_input.extend([param.name for param in pretrained_params.protos])
     net.external_output.extend([external_output])
     init_net = ConvertTensorProtosToInitNet(pretrained_params, external_input)
+    del pretrained_params
 
     with open(output_predict_net, 'wb') as f:
         f.write(net.SerializeToString())
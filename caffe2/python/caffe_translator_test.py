@@ -16,9 +16,11 @@
 # This a large test that goes through the translation of the bvlc caffenet
 # model, runs an example through the whole model, and verifies numerically
 # that all the results look right. In default, it is disabled unless you
-# explicitly want to run it.
+# explicitly want to run it. TestConvertTensorProtosToInitNet needs no
+# test data.
 
 from caffe.proto import caffe_pb2
+from caffe2.proto import caffe2_pb2
 from google.protobuf import text_format
 import numpy as np
 import os
@@ -27,40 +29,104 @@ import sys
 import unittest
 
 
+class TestConvertTensorProtosToInitNet(test_util.TestCase):
+    def _make_tensor(self, name, data_type, data_field, values):
+        tensor = caffe2_pb2.TensorProto()
+        tensor.name = name
+        tensor.data_type = data_type
+        tensor.dims.extend([2, 3])
+        getattr(tensor, data_field).extend(values)
+        return tensor
+
+    def testSupportedTypes(self):
+        net_params = caffe2_pb2.TensorProtos()
+        expected = {
+            "float_param": np.arange(6, dtype=np.float32).reshape(2, 3) / 7,
+            "int32_param": np.array(
+                [-2, -1, 0, 1, 2, 2 ** 31 - 1], dtype=np.int32).reshape(2, 3),
+            "int64_param": np.array(
+                [-2, -1, 0, 1, 2, 2 ** 40], dtype=np.int64).reshape(2, 3),
+        }
+        net_params.protos.extend([
+            self._make_tensor(
+                "float_param", caffe2_pb2.TensorProto.FLOAT, "float_data",
+                expected["float_param"].ravel().tolist()),
+            self._make_tensor(
+                "int32_param", caffe2_pb2.TensorProto.INT32, "int32_data",
+                expected["int32_param"].ravel().tolist()),
+            self._make_tensor(
+                "int64_param", caffe2_pb2.TensorProto.INT64, "int64_data",
+                expected["int64_param"].ravel().tolist()),
+        ])
+        init_net = caffe_translator.ConvertTensorProtosToInitNet(
+            net_params, "data")
+        self.assertEqual(
+            [op.type for op in init_net.op],
+            ["GivenTensorFill", "GivenTensorIntFill", "GivenTensorInt64Fill",
+             "ConstantFill"])
+        workspace.RunNetOnce(init_net)
+        for name, value in expected.items():
+            result = workspace.FetchBlob(name)
+            self.assertEqual(result.dtype, value.dtype)
+            np.testing.assert_array_equal(result, value)
+        self.assertTrue(workspace.HasBlob("data"))
+
+    def testUnsupportedTypes(self):
+        for data_type, data_field in [
+            (caffe2_pb2.TensorProto.DOUBLE, "double_data"),
+            (caffe2_pb2.TensorProto.FLOAT16, "int32_data"),
+            (caffe2_pb2.TensorProto.UINT8, "int32_data"),
+        ]:
+            net_params = caffe2_pb2.TensorProtos()
+            net_params.protos.extend([self._make_tensor(
+                "param", data_type, data_field, [1, 2, 3, 4, 5, 6])])
+            with self.assertRaises(RuntimeError):
+                caffe_translator.ConvertTensorProtosToInitNet(
+                    net_params, "data")
+
+    def testEmptyData(self):
+        net_params = caffe2_pb2.TensorProtos()
+        net_params.protos.extend([self._make_tensor(
+            "param", caffe2_pb2.TensorProto.FLOAT, "float_data", [])])
+        with self.assertRaises(RuntimeError):
+            caffe_translator.ConvertTensorProtosToInitNet(net_params, "data")
+
+
 @unittest.skipIf(not os.path.exists('data/testdata/caffe_translator'),
                  'No testdata existing for the caffe translator test. Exiting.')
-def setUpModule():
-    # We will do all the computation stuff in the global space.
-    caffenet = caffe_pb2.NetParameter()
-    caffenet_pretrained = caffe_pb2.NetParameter()
-    text_format.Merge(
-        open('data/testdata/caffe_translator/deploy.prototxt').read(), caffenet
-    )
-    caffenet_pretrained.ParseFromString(
-        open(
-            'data/testdata/caffe_translator/bvlc_reference_caffenet.caffemodel')
-        .read()
-    )
-    for remove_legacy_pad in [True, False]:
-        net, pretrained_params = caffe_translator.TranslateModel(
-            caffenet, caffenet_pretrained, is_test=True,
-            remove_legacy_pad=remove_legacy_pad
+class TestNumericalEquivalence(test_util.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestNumericalEquivalence, cls).setUpClass()
+        # We will do all the computation stuff in the global space.
+        caffenet = caffe_pb2.NetParameter()
+        caffenet_pretrained = caffe_pb2.NetParameter()
+        text_format.Merge(
+            open('data/testdata/caffe_translator/deploy.prototxt').read(), caffenet
         )
-        with open('data/testdata/caffe_translator/'
-                  'bvlc_reference_caffenet.translatedmodel',
-                  'w') as fid:
-            fid.write(str(net))
-        for param in pretrained_params.protos:
-            workspace.FeedBlob(param.name, utils.Caffe2TensorToNumpyArray(param))
-        # Let's also feed in the data from the Caffe test code.
-        data = np.load('data/testdata/caffe_translator/data_dump.npy').astype(
-            np.float32)
-        workspace.FeedBlob('data', data)
-        # Actually running the test.
-        workspace.RunNetOnce(net.SerializeToString())
-
+        caffenet_pretrained.ParseFromString(
+            open(
+                'data/testdata/caffe_translator/bvlc_reference_caffenet.caffemodel')
+            .read()
+        )
+        for remove_legacy_pad in [True, False]:
+            net, pretrained_params = caffe_translator.TranslateModel(
+                caffenet, caffenet_pretrained, is_test=True,
+                remove_legacy_pad=remove_legacy_pad
+            )
+            with open('data/testdata/caffe_translator/'
+                      'bvlc_reference_caffenet.translatedmodel',
+                      'w') as fid:
+                fid.write(str(net))
+            for param in pretrained_params.protos:
+                workspace.FeedBlob(param.name, utils.Caffe2TensorToNumpyArray(param))
+            # Let's also feed in the data from the Caffe test code.
+            data = np.load('data/testdata/caffe_translator/data_dump.npy').astype(
+                np.float32)
+            workspace.FeedBlob('data', data)
+            # Actually running the test.
+            workspace.RunNetOnce(net.SerializeToString())
 
-class TestNumericalEquivalence(test_util.TestCase):
     def testBlobs(self):
         names = [
             "conv1", "pool1", "norm1", "conv2", "pool2", "norm2", "conv3",
@@ -178,6 +178,7 @@ class CheckpointManager(object):
         self._net = core.Net('!!checkpoint_mngr')
         self._blob_names = self._net.AddExternalInput('blob_names')
         self._names_output = None
+        self._blob_list_cache = None
         self._path_prefix = None
         self._path_type = None
 
@@ -219,19 +220,24 @@ class CheckpointManager(object):
                 full_db_name = db_name(retrieve_from_epoch,
                                         self._node_name, self._db_prefix, path_prefix)
                 db_type = path_type or self._db_type
-                logger.info("Initializing checkpoints from = %s"
-                            % full_db_name)
+                logger.info("Initializing checkpoints from = %s",
+                            full_db_name)
                 ops.Load(
                     [], self._blob_names,
                     db=full_db_name,
                     db_type=db_type,
                     absolute_path=True)
         self._names_output = task.outputs()[0]
+        self._blob_list_cache = None
         return task
 
     def blob_list(self):
         assert self._names_output
-        return self._names_output.fetch().tolist()
+        # The set of blob names is fixed once the init task has run, so fetch
+        # it only once instead of on every save and load.
+        if self._blob_list_cache is None:
+            self._blob_list_cache = self._names_output.fetch().tolist()
+        return self._blob_list_cache
 
     def load(self, epoch, path_prefix=None, path_type=None):
         """
@@ -241,7 +247,7 @@ class CheckpointManager(object):
         """
         full_db_name = db_name(epoch, self._node_name, self._db_prefix, path_prefix)
         db_type = path_type or self._db_type
-        logger.info("Loading checkpoints from = %s" % full_db_name)
+        logger.info("Loading checkpoints from = %s", full_db_name)
         with Task() as task:
             ops.Load(
                 [],
@@ -266,26 +272,31 @@ class CheckpointManager(object):
             A Task which loads the specified blobs from the checkpoint of the
             given epoch.
         """
-        logger.info('Load from %s' % db_name(epoch, self._node_name, self._db_prefix))
         with Task() as task:
-            ops.Load(
-                [],
-                blob_names,
-                db=db_name(epoch, self._node_name, self._db_prefix),
-                db_type=self._db_type,
-                absolute_path=True,
-                allow_incomplete=True)
+            self._add_load_blobs_op(blob_names, epoch)
         return task
 
+    def _add_load_blobs_op(self, blob_names, epoch):
+        """Adds the Load op of load_blobs_from_checkpoint to the current net."""
+        full_db_name = db_name(epoch, self._node_name, self._db_prefix)
+        logger.info('Load from %s', full_db_name)
+        ops.Load(
+            [],
+            blob_names,
+            db=full_db_name,
+            db_type=self._db_type,
+            absolute_path=True,
+            allow_incomplete=True)
+
     def check_db_exists(self, epoch):
-        logger.info('Check existence of %s' %
-                    db_name(epoch, self._node_name, self._db_prefix))
+        full_db_name = db_name(epoch, self._node_name, self._db_prefix)
+        logger.info('Check existence of %s', full_db_name)
         with Task() as task:
             existence = ops.Const(False)
             ops.DBExists(
                 [],
                 [existence],
-                db_name=db_name(epoch, self._node_name, self._db_prefix),
+                db_name=full_db_name,
                 db_type=self._db_type,
                 absolute_path=True)
             task.add_output(existence)
@@ -297,11 +308,13 @@ class CheckpointManager(object):
         epoch is run. This will execute a Save ops to serialize and persist
         blobs present in the global workspace.
         """
-        logger.info('Saving to %s' % db_name(epoch, self._node_name, self._db_prefix))
+        full_db_name = db_name(epoch, self._node_name, self._db_prefix)
+        logger.info('Saving to %s', full_db_name)
+        # A single Save op serializes all the blobs into one db write.
         with Task() as task:
             ops.Save(
                 self.blob_list(), [],
-                db=db_name(epoch, self._node_name, self._db_prefix),
+                db=full_db_name,
                 db_type=self._db_type, absolute_path=True)
         return task
 
@@ -398,6 +411,25 @@ class MultiNodeCheckpointManager(object):
                     func(manager, *args, **kw)
             return task_group
 
+    def _ensure_node_managers(self, nodes):
+        """Creates a CheckpointManager for each node, unless already created.
+
+        Returns:
+            True if the node managers were created by this call.
+        """
+        if self._node_managers is not None:
+            assert [node for node, _ in self._node_managers] == nodes
+            return False
+        self._node_managers = []
+        for node in nodes:
+            with Node(node):
+                manager = CheckpointManager(
+                    db_prefix=self._db_prefix,
+                    node_name=str(node),
+                    db_type=self._db_type)
+                self._node_managers.append((node, manager))
+        return True
+
     """
     Args:
         nodes: An array of nodes where this checkpoint manager is running.
@@ -409,20 +441,11 @@ class MultiNodeCheckpointManager(object):
     def init(
         self, nodes, retrieve_from_epoch=None, path_prefix=None, path_type=None
     ):
-        if self._node_managers is not None:
-            assert [node for node, _ in self._node_managers] == nodes
+        if not self._ensure_node_managers(nodes):
             return TaskGroup(WorkspaceType.GLOBAL)
-        self._node_managers = []
-        for node in nodes:
-            with Node(node):
-                manager = CheckpointManager(
-                    db_prefix=self._db_prefix,
-                    node_name=str(node),
-                    db_type=self._db_type)
-                self._node_managers.append((node, manager))
         return self._task_group(
             CheckpointManager.init,
-            nodes=[node],
+            nodes=nodes[-1:],
             retrieve_from_epoch=retrieve_from_epoch,
             path_prefix=path_prefix,
             path_type=path_type)
@@ -437,34 +460,41 @@ class MultiNodeCheckpointManager(object):
     def load_blobs_locally(self, nodes, blob_names, epoch, session):
         """Loads the necessary blobs from the checkpoints to the current node.
 
+        The load is all-or-nothing: the dbs of all the nodes are checked
+        before any of them is read, and if one of them is missing no blob is
+        loaded at all, not even from the nodes whose dbs do exist.
+
         Args:
             blob_names: A list of strings. Each string is the name of a
                 blob.
             epoch: An integer. The checkpoint epoch to load from.
             session: A Session object to execute the Load ops.
+
+        Returns:
+            True if the blobs were loaded, False if the db of any node is
+            missing.
         """
-        if self._node_managers is not None:
-            assert [node for node, _ in self._node_managers] == nodes
-        else:
-            self._node_managers = []
-            for node in nodes:
-                with Node(node):
-                    manager = CheckpointManager(
-                        db_prefix=self._db_prefix,
-                        node_name=str(node),
-                        db_type=self._db_type)
-                    self._node_managers.append((node, manager))
-        assert self._node_managers is not None, 'must initialize node managers'
-        for _, manager in self._node_managers:
-            existence_task = manager.check_db_exists(epoch)
-            session.run(existence_task)
-            existence = existence_task.outputs()[0].fetch()
-            if not existence:
-                logger.info('DB %s does not exist!' %
+        self._ensure_node_managers(nodes)
+        # Probe all the node dbs in a single run; the probes are independent
+        # so they can execute concurrently.
+        with TaskGroup(WorkspaceType.GLOBAL) as existence_group:
+            existence_tasks = [
+                manager.check_db_exists(epoch)
+                for _, manager in self._node_managers]
+        session.run(existence_group)
+        for (_, manager), existence_task in zip(
+                self._node_managers, existence_tasks):
+            if not existence_task.outputs()[0].fetch():
+                logger.info('DB %s does not exist!',
                             db_name(epoch, manager._node_name, manager._db_prefix))
                 return False
-            load_task = manager.load_blobs_from_checkpoint(blob_names, epoch)
-            session.run(load_task)
+        # Load from all the dbs in a single run. The Load ops are chained in
+        # one net so they still execute in node order, and the last node wins
+        # if several dbs hold the same blob.
+        with Task() as load_task:
+            for _, manager in self._node_managers:
+                manager._add_load_blobs_op(blob_names, epoch)
+        session.run(load_task)
         logger.info('Successfully loaded from checkpoints.')
         return True
 
@@ -624,7 +654,7 @@ class JobRunner(object):
             self.resume_from_epoch = self.checkpoint_manager.\
                 get_resume_from_epoch_id(self.resume_from_epoch)
             if self.resume_from_epoch is not None:
-                logger.info('Resuming from epoch {}'.format(self.resume_from_epoch))
+                logger.info('Resuming from epoch %s', self.resume_from_epoch)
 
         # Initialize all the nodes.
         from_scratch = self.resume_from_epoch is None
@@ -641,8 +671,8 @@ class JobRunner(object):
             if from_scratch:
                 self.save_checkpoints(0, session)
             else:
-                logger.info('Loading checkpoints for epoch {} ...'.format(
-                    self.resume_from_epoch))
+                logger.info('Loading checkpoints for epoch %s ...',
+                            self.resume_from_epoch)
                 session.run(
                     self.checkpoint_manager.load(self.resume_from_epoch))
                 logger.info('Checkpoint loaded')
@@ -652,15 +682,16 @@ class JobRunner(object):
         # Start training.
         epoch = 1 if from_scratch else self.resume_from_epoch + 1
         while True:
-            logger.info('Starting epoch %d' % epoch)
+            logger.info('Starting epoch %d', epoch)
             session.run(self.job.epoch_group)
-            logger.info('Finished epoch %d' % epoch)
-            stop_signals = [o.fetch() for o in self.job.stop_signals]
+            logger.info('Finished epoch %d', epoch)
+            # Stop fetching as soon as one of the signals is set.
+            should_stop = any(o.fetch() for o in self.job.stop_signals)
 
             if self.checkpoint_manager:
                 self.save_checkpoints(epoch, session)
 
-            if any(stop_signals):
+            if should_stop:
                 logger.info('Stopping')
                 break
             epoch += 1
@@ -703,7 +734,7 @@ class JobRunner(object):
         """
         if not self.checkpoint_manager:
             raise ValueError('Checkpoint manager is None')
-        logger.info('Loading checkpoint for epoch {} ...'.format(epoch))
+        logger.info('Loading checkpoint for epoch %s ...', epoch)
         return self.checkpoint_manager.load_blobs_locally(
             self.job.nodes_to_checkpoint(), blob_names, epoch, session)
 
@@ -725,15 +756,15 @@ class JobRunner(object):
         try:
             is_accessible = self.checkpoint_manager.cp_accessible(epoch=None)
             if is_accessible:
-                logger.info('Saving checkpoints for epoch {}'.format(epoch))
+                logger.info('Saving checkpoints for epoch %s', epoch)
                 session.run(self.checkpoint_manager.save(epoch))
                 self.checkpoint_manager.write_checkpoint_metadata(epoch)
                 logger.info('Checkpoints saved')
             else:
                 logger.warning("Checkpoint files cannot be accessed!")
         except Exception as ex:
-            logger.warning("Unable to write checkpoint for epoch {}. Error={}".
-                            format(epoch, ex))
+            logger.warning("Unable to write checkpoint for epoch %s. Error=%s",
+                           epoch, ex)
 
 
 def epoch_limiter(num_epochs):
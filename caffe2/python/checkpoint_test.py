@@ -39,7 +39,7 @@ import tempfile
 def build_pipeline(node_id):
     with Node('trainer_%d' % node_id):
         with Job.current().init_group, Task():
-            data_arr = Struct(('val', np.array(list(range(10)))))
+            data_arr = Struct(('val', np.arange(10, dtype=np.int64)))
             data = ConstRecord(ops, data_arr)
             ds = Dataset(data, name='dataset:%d' % node_id)
             full_reader = ds.reader(ops)
@@ -212,6 +212,52 @@ class TestCheckpoint(TestCase):
         finally:
             shutil.rmtree(tmpdir)
 
+    def test_load_blobs_locally_with_missing_db(self):
+        try:
+            num_nodes = 3
+            tmpdir = tempfile.mkdtemp()
+            for node_id in range(num_nodes):
+                ws = workspace.C.Workspace()
+                session = LocalSession(ws)
+                checkpoint = MultiNodeCheckpointManager(tmpdir, 'minidb')
+                with Cluster():
+                    with Job() as job:
+                        build_pipeline(node_id)
+                    compiled_job = job.compile(LocalSession)
+                    JobRunner(compiled_job, checkpoint)(session)
+
+            # Remove the epoch 2 db of the last node only.
+            os.remove(db_name(2, 'trainer_2', tmpdir))
+
+            ws = workspace.C.Workspace()
+            session = LocalSession(ws)
+            model_blob_names = ['trainer_0/task_2/GivenTensorInt64Fill:0',
+                                'trainer_1/task_2/GivenTensorInt64Fill:0']
+            checkpoint = MultiNodeCheckpointManager(tmpdir, 'minidb')
+            with Cluster():
+                with Job() as job:
+                    for node_id in range(num_nodes):
+                        build_pipeline(node_id)
+                compiled_job = job.compile(LocalSession)
+                job_runner = JobRunner(compiled_job, checkpoint)
+                self.assertTrue(
+                    job_runner.load_blobs_from_checkpoints(
+                        blob_names=model_blob_names, epoch=1,
+                        session=session))
+
+                # The dbs of trainer_0 and trainer_1 exist for epoch 2, but
+                # nothing is loaded from them because trainer_2's is missing.
+                self.assertFalse(
+                    job_runner.load_blobs_from_checkpoints(
+                        blob_names=model_blob_names, epoch=2,
+                        session=session))
+                for blob_name in model_blob_names:
+                    self.assertEquals(
+                        ws.fetch_blob(blob_name),
+                        np.array([EXPECTED_TOTALS[0]]))
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_upload_checkpoint(self):
         try:
             tmpdir = tempfile.mkdtemp()
@@ -19,7 +19,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from collections import OrderedDict
+from collections import Counter, OrderedDict
+from itertools import chain
 from future.utils import viewitems, viewkeys, viewvalues
 import logging
 import copy
@@ -70,6 +71,8 @@ def Parallelize(
     num_threads_per_device=4,
     shared_model=False,
     combine_spatial_bn=False,
+    allreduce_bucket_num_blobs=None,
+    fp16_allreduce=False,
 ):
     '''
     Function to create a model that can run on many GPUs or CPUs.
@@ -120,6 +123,20 @@ def Parallelize(
                         all devices within the node. If False, batch
                         normalization will be done separately for each device.
                         This option is currently only supported on the CPU.
+      allreduce_bucket_num_blobs:
+                        If set (and use_nccl is True), dense GPU gradients are
+                        flattened and concatenated in groups of this many
+                        blobs (a blob count, not a size in bytes), so that
+                        each group is reduced with a single NCCLAllreduce.
+                        Each bucket costs one extra copy of its gradients into
+                        the fused blob and one back out, so this only pays
+                        off for models with many small parameters, where the
+                        per-collective launch latency dominates. Only applies
+                        to single-host training.
+      fp16_allreduce:   If True (and use_nccl is True), dense GPU gradients
+                        are converted to half precision for the NCCLAllreduce
+                        and converted back afterwards, halving the amount of
+                        data exchanged. Only applies to single-host training.
     '''
     assert scope.CurrentDeviceScope() is None \
         or scope.CurrentDeviceScope().device_type == caffe2_pb2.CPU, \
@@ -175,6 +192,12 @@ def Parallelize(
     num_shards = 1 if rendezvous is None else rendezvous['num_shards']
     loss_scale = 1.0 / (len(devices) * num_shards)
 
+    if fp16_allreduce and (cpu_device or not use_nccl or num_shards > 1):
+        log.warning(
+            "fp16_allreduce is only supported for single-host GPU training "
+            "with use_nccl=True; gradients will be reduced in fp32"
+        )
+
     has_parameter_updates = param_update_builder_fun is not None or \
         optimizer_builder_fun is not None
     assert not (
@@ -252,8 +275,9 @@ def Parallelize(
 
     # Group gradients by device and register to blob lookup
     param_to_grad = model_helper_obj.param_to_grad
-    grads_ordered = [param_to_grad[p] for p in
-                     model_helper_obj.params if p in param_to_grad]
+    grads_ordered = [g for g in
+                     (param_to_grad.get(p) for p in model_helper_obj.params)
+                     if g is not None]
     non_datapar_grads = [param_to_grad[p] for p in non_datapar_params]
 
     gradients_grouped = _GroupByDevice(
@@ -284,6 +308,8 @@ def Parallelize(
             rendezvous,
             use_nccl,
             max_concurrent_distributed_ops,
+            allreduce_bucket_num_blobs,
+            fp16_allreduce,
         )
     else:
         log.info("NOTE: Param builder function did not create any parameters.")
@@ -320,12 +346,6 @@ def Parallelize(
     _InferBlobDevice(model_helper_obj)
     _AnalyzeOperators(model_helper_obj)
 
-    # Configure dagnet to run with only one worker on the first iteration,
-    # to prevent concurrency problems with allocs and nccl.
-    arg = model_helper_obj.Proto().arg.add()
-    arg.name = "first_iter_only_one_worker"
-    arg.i = 1
-
     # Add initial parameter syncs
     log.info("Add initial parameter sync")
     _SyncAllParams(
@@ -397,7 +417,8 @@ def Parallelize_BMUF(
     max_concurrent_distributed_ops=4,
     add_blobs_to_sync=None,
     num_threads_per_device=4,
-    cpu_device=False
+    cpu_device=False,
+    allreduce_bucket_num_blobs=None,
 ):
     '''
     Function to create model that run on many GPUs and creates a net for
@@ -407,6 +428,9 @@ def Parallelize_BMUF(
     in : Scalable Training of Deep Learning Machines by Incremental Block
     Training with Intra-block Parallel Optimization and Blockwise Model-Update
     Filtering (ICASSP 2016).
+
+    As in Parallelize, allreduce_bucket_num_blobs fuses the parameter
+    averaging allreduces into groups of that many blobs when use_nccl is set.
     '''
     assert scope.CurrentDeviceScope() is None \
         or scope.CurrentDeviceScope().device_type == caffe2_pb2.CPU, \
@@ -527,6 +551,10 @@ def Parallelize_BMUF(
     model_parameter_names = list(
         viewkeys(model_helper_obj._device_grouped_blobs)
     )
+    master_params = [
+        model_helper_obj._device_grouped_blobs[param_name][master_device]
+        for param_name in model_parameter_names
+    ]
     if warmup_iterations is not None:
         model_helper_obj._warmup_iterations = warmup_iterations
         # A net for broadcasting gpu-0 (master shard) parameters after
@@ -545,14 +573,12 @@ def Parallelize_BMUF(
             model_parameter_names,
             max_concurrent_distributed_ops
         )
-        for param_name in viewkeys(model_helper_obj._device_grouped_blobs):
-            param = model_helper_obj._device_grouped_blobs[param_name][master_device]
+        for param in master_params:
             with core.DeviceScope(master_dev_opt):
                 model_helper_obj._warmup_broadcast.Copy(param, _g(param))
 
     # (Step-0) Initialize momentum parameters on master device.
-    for param_name in viewkeys(model_helper_obj._device_grouped_blobs):
-        param = model_helper_obj._device_grouped_blobs[param_name][master_device]
+    for param in master_params:
         with core.DeviceScope(master_dev_opt):
             model_helper_obj._global_model_init_net.ConstantFill(
                 param, _v(param), value=0.0
@@ -574,7 +600,8 @@ def Parallelize_BMUF(
         model_helper_obj._global_model_param_updates_net,
         rendezvous,
         use_nccl,
-        max_concurrent_distributed_ops
+        max_concurrent_distributed_ops,
+        allreduce_bucket_num_blobs,
     )
 
     # (Step-3) Update momentum params :
@@ -586,24 +613,33 @@ def Parallelize_BMUF(
     # param_v_prev = param_v
     # else:
     # param = param + param_v
-    for param_name in model_parameter_names:
-        param = model_helper_obj._device_grouped_blobs[param_name][master_device]
+    #
+    # param_avg is the summed param scaled by 1 / num_devices. The block delta
+    # (param_avg - param) is computed in place first, then folded into param_v,
+    # keeping the summation order of the unfused Scale/Sub/Scale/Add sequence.
+    master_prefix = "{}_{}/".format(
+        model_helper_obj._device_prefix, master_device)
+    with core.DeviceScope(master_dev_opt):
+        bmuf_weights = [
+            model_helper_obj._global_model_init_net.ConstantFill(
+                [], master_prefix + name, shape=[1], value=float(value)
+            )
+            for name, value in [
+                ("bmuf_inv_num_devices", 1.0 / num_devices),
+                ("bmuf_neg_one", -1.0),
+                ("bmuf_block_momentum", block_momentum),
+                ("bmuf_block_learning_rate", block_learning_rate),
+            ]
+        ]
+    inv_devices_w, neg_one_w, momentum_w, lr_w = bmuf_weights
+    for param in master_params:
         with core.DeviceScope(master_dev_opt):
             # TODO(ataei) : Stop building the graph here to get model average ?
-            model_helper_obj._global_model_param_updates_net.Scale(
-                param, param, scale=1.0 / num_devices
-            )
-            model_helper_obj._global_model_param_updates_net.Sub(
-                [param, _g(param)], param
+            model_helper_obj._global_model_param_updates_net.WeightedSum(
+                [param, inv_devices_w, _g(param), neg_one_w], param
             )
-            model_helper_obj._global_model_param_updates_net.Scale(
-                param, param, scale=block_learning_rate
-            )
-            model_helper_obj._global_model_param_updates_net.Scale(
-                _v(param), _v(param), scale=block_momentum
-            )
-            model_helper_obj._global_model_param_updates_net.Add(
-                [_v(param), param], _v(param)
+            model_helper_obj._global_model_param_updates_net.WeightedSum(
+                [_v(param), momentum_w, param, lr_w], _v(param)
             )
             model_helper_obj._global_model_param_updates_net.Add(
                 [_g(param), _v(param)], _g(param)
@@ -817,19 +853,20 @@ def GetCheckpointParams(model):
     They are blobs for the first gpu and iteration blobs.
     '''
     (all_blobs, _) = _ComputeBlobsToSync(model)
+    first_gpu_prefix = "{}_{}/".format(model._device_prefix, model._devices[0])
     first_gpu_blobs = {
         b
         for b in all_blobs
-        if str(b)
-        .startswith("{}_{}/".format(model._device_prefix, model._devices[0]))
+        if str(b).startswith(first_gpu_prefix)
     }
 
     # Add iteration blobs that do not have namescope separately, since
     # it is important to checkpoint iteration counter
     iteration_blobs = set()
+    device_prefix = "{}_".format(model._device_prefix)
     for op in model.net.Proto().op:
         if op.type == 'Iter' or op.type == 'AtomicIter':
-            if not op.output[0].startswith("{}_".format(model._device_prefix)):
+            if not op.output[0].startswith(device_prefix):
                 iteration_blobs.add(op.output[0])
 
     return first_gpu_blobs.union(iteration_blobs)
@@ -915,44 +952,56 @@ def GetLearningRateBlobNames(model):
 def _Broadcast(devices, model, net, param, use_nccl=False):
     # Copy params from gpu_0 to other
     master_dev = devices[0]
+    is_gpu_blob = _IsGPUBlob(model, param)
+    grouped = model._device_grouped_blobs[param]
 
     if use_nccl:
-        if _IsGPUBlob(model, param):
+        if is_gpu_blob:
             master_device_opt = core.DeviceOption(model._device_type, master_dev)
             with core.DeviceScope(master_device_opt):
                 # Note that the root is the root _rank_ and not the root
                 # _device_. Thus we always use root=0, regardless of the
                 # devices used.
-                net.NCCLBroadcast(
-                    list(viewvalues(model._device_grouped_blobs[param])),
-                    list(viewvalues(model._device_grouped_blobs[param])),
-                    root=0,
-                )
+                blobs_group = list(viewvalues(grouped))
+                net.NCCLBroadcast(blobs_group, blobs_group, root=0)
                 return
 
-    for dev_idx in devices[1:]:
-        if _IsGPUBlob(model, param):
-            device_opt = core.DeviceOption(caffe2_pb2.CUDA, dev_idx)
-        else:
-            device_opt = core.DeviceOption(caffe2_pb2.CPU, 0)
-        with core.DeviceScope(device_opt):
-            net.Copy(
-                model._device_grouped_blobs[param][master_dev],
-                model._device_grouped_blobs[param][dev_idx]
-            )
+    if is_gpu_blob:
+        # Tree broadcast: at every level, each device that already holds the
+        # value copies it to one that does not, so the master sends log2(N)
+        # copies instead of N - 1.
+        num_devices = len(devices)
+        num_sources = 1
+        while num_sources < num_devices:
+            for j in range(min(num_sources, num_devices - num_sources)):
+                dst_dev = devices[j + num_sources]
+                device_opt = core.DeviceOption(caffe2_pb2.CUDA, dst_dev)
+                with core.DeviceScope(device_opt):
+                    net.Copy(grouped[devices[j]], grouped[dst_dev])
+            num_sources *= 2
+        return
+
+    master_blob = grouped[master_dev]
+    with core.DeviceScope(core.DeviceOption(caffe2_pb2.CPU, 0)):
+        for dev_idx in devices[1:]:
+            net.Copy(master_blob, grouped[dev_idx])
 
 
-def _AllReduce(devices, model, net, param, use_nccl=False, control_input=None):
+def _AllReduce(devices, model, net, param, use_nccl=False, control_input=None,
+               fp16=False):
     blobs_group = list(viewvalues(model._device_grouped_blobs[param]))
     if model._device_type == caffe2_pb2.CUDA and use_nccl:
         # TODO: for _shared_model, do only NCCLReduce
-        model.NCCLAllreduce(
-            blobs_group, blobs_group, control_input=control_input
-        )
+        if fp16:
+            _NCCLAllreduceHalf(devices, model, net, blobs_group, control_input)
+        else:
+            model.NCCLAllreduce(
+                blobs_group, blobs_group, control_input=control_input
+            )
         return
 
     if model._device_type == caffe2_pb2.CUDA:
-        p2p_access_pattern = workspace.GetCudaPeerAccessPattern()
+        p2p_access_pattern = _GetCudaPeerAccessPattern(model)
     else:
         p2p_access_pattern = None
 
@@ -981,31 +1030,48 @@ def _AllReduce(devices, model, net, param, use_nccl=False, control_input=None):
         with core.DeviceScope(device_opt):
             net.Sum(blobs, [blobs[0]], name='dpm')
 
-    if len(devices) == 16:
-        # Special tree reduction for 16 gpus, TODO generalize like in muji.py
-        for j in range(8):
-            sumN(j * 2, j * 2 + 1)
-        for j in range(4):
-            sumN(j * 4, j * 4 + 2)
-        for j in range(2):
-            sumN(j * 8, j * 8 + 4)
-        sumN(0, 8)
-    elif len(devices) == 8:
-        for j in range(4):
-            sumN(j * 2, j * 2 + 1)
-        for j in range(2):
-            sumN(j * 4, j * 4 + 2)
-        sumN(0, 4)
-    elif len(devices) == 4:
-        sumN(0, 1)
-        sumN(2, 3)
-        sumN(0, 2)
-    else:
-        sumN(*range(len(devices)))
+    # Pairwise tree reduction onto the first device: at every level, device
+    # j accumulates the partial sum of device j + stride, so the master only
+    # receives log2(N) tensors instead of N - 1. For 4, 8 and 16 devices
+    # this is the same schedule as the former hand-written trees.
+    num_devices = len(devices)
+    stride = 1
+    while stride < num_devices:
+        for j in range(0, num_devices - stride, 2 * stride):
+            sumN(j, j + stride)
+        stride *= 2
     # TODO: for _shared_model, no need to broadcast
     _Broadcast(devices, model, net, param)
 
 
+def _GetCudaPeerAccessPattern(model):
+    '''
+    Returns the CUDA peer access matrix, queried once per model.
+    '''
+    pattern = getattr(model, '_p2p_access_pattern', None)
+    if pattern is None:
+        pattern = workspace.GetCudaPeerAccessPattern()
+        model._p2p_access_pattern = pattern
+    return pattern
+
+
+def _NCCLAllreduceHalf(devices, model, net, blobs_group, control_input=None):
+    '''
+    In-place NCCLAllreduce of float blobs (one per device, in device order)
+    that exchanges and sums them in half precision.
+    '''
+    half_group = []
+    for device, blob in zip(devices, blobs_group):
+        with core.DeviceScope(core.DeviceOption(model._device_type, device)):
+            half_group.append(net.FloatToHalf(blob, str(blob) + "_fp16"))
+
+    net.NCCLAllreduce(half_group, half_group, control_input=control_input)
+
+    for device, blob, half in zip(devices, blobs_group, half_group):
+        with core.DeviceScope(core.DeviceOption(model._device_type, device)):
+            net.HalfToFloat(half, blob)
+
+
 def _SyncAllParams(
     devices,
     model,
@@ -1101,8 +1167,9 @@ def _SyncAllParamsDistributed(
     context = model._broadcast_context
 
     for param_name in sorted(unique_param_names):
-        master_param = model._device_grouped_blobs[param_name][devices[0]]
-        params_group = list(viewvalues(model._device_grouped_blobs[param_name]))
+        grouped = model._device_grouped_blobs[param_name]
+        master_param = grouped[devices[0]]
+        params_group = list(viewvalues(grouped))
 
         def broadcast(params):
             comm_world, control_input = context.get_control_and_context(params)
@@ -1115,13 +1182,19 @@ def _SyncAllParamsDistributed(
                 control_input=control_input
             )
 
-        device_opt = gpu_device_opt if _IsGPUBlob(
-            model, param_name
-        ) else cpu_device_opt
+        is_gpu_blob = _IsGPUBlob(model, param_name)
+        device_opt = gpu_device_opt if is_gpu_blob else cpu_device_opt
 
         if rendezvous['engine'] == 'GLOO':
             with core.DeviceScope(device_opt):
                 broadcast(params_group)
+        elif not is_gpu_blob:
+            # Already on CPU, no need to stage through host memory
+            with core.DeviceScope(cpu_device_opt):
+                broadcast([master_param])
+
+            # Broadcast locally
+            _Broadcast(devices, model, net, param_name)
         else:
             # Copy between GPU and CPU
             with core.DeviceScope(device_opt):
@@ -1144,14 +1217,17 @@ def _SyncAllParamsSingleHost(devices, model, net, unique_param_names):
 
 
 def _AllReduceBlobs(blob_names, devices, model, net, rendezvous, use_nccl,
-                    max_concurrent_distributed_ops):
+                    max_concurrent_distributed_ops, bucket_num_blobs=None,
+                    fp16=False):
     if rendezvous is None or rendezvous['num_shards'] <= 1:
         _AllReduceBlobsSingleHost(
             blob_names,
             devices,
             model,
             net,
-            use_nccl
+            use_nccl,
+            bucket_num_blobs,
+            fp16,
         )
     else:
         _AllReduceBlobsDistributed(
@@ -1283,15 +1359,12 @@ def _AllReduceBlobsDistributed(
     nccl_control_blob = None
 
     for blob_name in blob_names:
-        master_blob = model._device_grouped_blobs[blob_name][devices[0]]
-        blobs_group = list(viewvalues(model._device_grouped_blobs[blob_name]))
+        grouped = model._device_grouped_blobs[blob_name]
+        master_blob = grouped[devices[0]]
+        blobs_group = list(viewvalues(grouped))
 
         assert master_blob in blobs_group
 
-        # Remark: NCCLReduce does not support in-place modifications
-        # so we need a temporary blob
-        reduced_blob = str(master_blob) + "_red"
-
         def allreduce(blobs, **kwargs):
             with core.DeviceScope(reducing_device_opt):
                 comm_world, control_input = \
@@ -1317,8 +1390,6 @@ def _AllReduceBlobsDistributed(
         else:
             # Step 1: sum blobs from local GPUs to master GPU
             with core.DeviceScope(master_device_opt):
-                model.ConstantFill(master_blob, reduced_blob, value=0.0)
-
                 # Temp fix since NCCLReduce does not work
                 net.NCCLAllreduce(
                     blobs_group,
@@ -1326,19 +1397,16 @@ def _AllReduceBlobsDistributed(
                     control_input=nccl_control_blob,
                 )
                 nccl_control_blob = blobs_group[0]
-                net.Copy(master_blob, reduced_blob)
 
             # Step 2: allreduce between all hosts, between master GPUs
-            allreduce([reduced_blob])
-
-            with core.DeviceScope(master_device_opt):
-                net.Copy(reduced_blob, master_blob)
+            allreduce([master_blob])
 
             # Step 3: broadcast locally
             _Broadcast(devices, model, net, blob_name)
 
 
-def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
+def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl,
+                              bucket_num_blobs=None, fp16=False):
     """Performs NCCL AllReduce to distribute blobs to all the GPUs."""
 
     if len(devices) == 1:
@@ -1346,13 +1414,21 @@ def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
 
     # Now we need to Allreduce blobs on all the GPUs.
     # Pick GPU #0 as a master GPU.
-    master_device_opt = core.DeviceOption(model._device_type, devices[0])
+    device_opts = {
+        device: core.DeviceOption(model._device_type, device)
+        for device in devices
+    }
+    master_device_opt = device_opts[devices[0]]
     last_out = None
     concatenated_idx = set()
+    use_buckets = bucket_num_blobs is not None and bucket_num_blobs > 1 and \
+        use_nccl and model._device_type == caffe2_pb2.CUDA
+    bucket = []
 
     for blob_name in blob_names:
         # Group by blob_name for reduce.
-        blobs_group = list(viewvalues(model._device_grouped_blobs[blob_name]))
+        grouped = model._device_grouped_blobs[blob_name]
+        blobs_group = list(viewvalues(grouped))
         if len(blobs_group) == 1:
             # Non-reducible
             continue
@@ -1362,9 +1438,18 @@ def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
 
         if _IsGPUBlob(model, blob_name):
             with core.DeviceScope(master_device_opt):
-                if not isinstance(blobs_group[0], core.GradientSlice):
+                if use_buckets and \
+                        not isinstance(blobs_group[0], core.GradientSlice):
+                    bucket.append(blob_name)
+                    if len(bucket) == bucket_num_blobs:
+                        last_out = _AllReduceBucket(
+                            devices, model, net, bucket, last_out, fp16
+                        )
+                        bucket = []
+                elif not isinstance(blobs_group[0], core.GradientSlice):
                     _AllReduce(
-                        devices, model, net, blob_name, use_nccl, last_out
+                        devices, model, net, blob_name, use_nccl, last_out,
+                        fp16
                     )
                     # last_out is used to serialize the execution of nccls
                     last_out = blobs_group[0]
@@ -1378,10 +1463,9 @@ def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
                     or more grad blobs are gathered with the same indices
                     blob
                     '''
-                    skip_idx_concat = False
-                    for g in blobs_group:
-                        if g.indices in concatenated_idx:
-                            skip_idx_concat = True
+                    skip_idx_concat = any(
+                        g.indices in concatenated_idx for g in blobs_group
+                    )
 
                     if not skip_idx_concat:
                         grad_idx_concat, _ = net.Concat(
@@ -1391,21 +1475,19 @@ def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
                             axis=0,
                             name="note:data_parallel_model")
 
-                        for gpu, g in viewitems(model._device_grouped_blobs[blob_name]):
-                            device_opt = core.DeviceOption(model._device_type, gpu)
-                            with core.DeviceScope(device_opt):
-                                model.Copy(grad_idx_concat, g.indices)
-                                concatenated_idx.add(g.indices)
-
                     grad_val_concat, _ = net.Concat(
                         [g.values for g in blobs_group],
                         ["{}/{}_val_concat".format(master_ns, blob_name),
                          "{}/{}_val_splitinfo".format(master_ns, blob_name)],
                         axis=0, name="note:data_parallel_model")
 
-                    for gpu, g in viewitems(model._device_grouped_blobs[blob_name]):
-                        device_opt = core.DeviceOption(model._device_type, gpu)
-                        with core.DeviceScope(device_opt):
+                    # Copy the gathered indices and values back to every
+                    # device within a single device scope per device
+                    for gpu, g in viewitems(grouped):
+                        with core.DeviceScope(device_opts[gpu]):
+                            if not skip_idx_concat:
+                                model.Copy(grad_idx_concat, g.indices)
+                                concatenated_idx.add(g.indices)
                             model.Copy(grad_val_concat, g.values)
 
         else:
@@ -1417,6 +1499,64 @@ def _AllReduceBlobsSingleHost(blob_names, devices, model, net, use_nccl):
                 if not model._shared_model:
                     _Broadcast(devices, model, net, blob_name)
 
+    if bucket:
+        with core.DeviceScope(master_device_opt):
+            _AllReduceBucket(devices, model, net, bucket, last_out, fp16)
+
+
+def _AllReduceBucket(devices, model, net, blob_names, control_input=None,
+                     fp16=False):
+    """
+    Flattens and concatenates the given blobs on every GPU, reduces the fused
+    blobs with a single NCCLAllreduce and splits the result back in place.
+    The blobs are flattened and restored with in-place Reshapes, so the only
+    copies are the Concat into and the Split out of the fused blob.
+    Returns the master fused blob, to be used as control input of the next
+    collective.
+    """
+    fused_group = []
+    unfused = {}
+    for device in devices:
+        device_opt = core.DeviceOption(model._device_type, device)
+        with core.DeviceScope(device_opt):
+            blobs = [model._device_grouped_blobs[name][device]
+                     for name in blob_names]
+            shapes = []
+            for blob in blobs:
+                _, shape = net.Reshape(
+                    [blob],
+                    [blob, str(blob) + "_bucket_old_shape"],
+                    shape=[-1],
+                )
+                shapes.append(shape)
+            prefix = "{}_{}/{}".format(
+                model._device_prefix, device, blob_names[0])
+            fused, split_info = net.Concat(
+                blobs,
+                [prefix + "_bucket", prefix + "_bucket_splitinfo"],
+                axis=0,
+            )
+            fused_group.append(fused)
+            unfused[device] = (blobs, shapes, split_info)
+
+    if fp16:
+        _NCCLAllreduceHalf(devices, model, net, fused_group, control_input)
+    else:
+        net.NCCLAllreduce(
+            fused_group, fused_group, control_input=control_input
+        )
+
+    for device, fused in zip(devices, fused_group):
+        blobs, shapes, split_info = unfused[device]
+        device_opt = core.DeviceOption(model._device_type, device)
+        with core.DeviceScope(device_opt):
+            net.Split([fused, split_info], blobs, axis=0)
+            for blob, shape in zip(blobs, shapes):
+                net.Reshape(
+                    [blob, shape], [blob, str(blob) + "_bucket_new_shape"]
+                )
+    return fused_group[0]
+
 
 def _BroadcastComputedParams(devices, model, rendezvous, use_nccl=False):
     if rendezvous is None:
@@ -1470,8 +1610,18 @@ def _AnalyzeOperators(model):
     '''
     Look at all the operators and check that they do not cross device scopes
     '''
+    device_prefix = "{}_".format(model._device_prefix)
+    namescopes = {}
+    # Whether an op type is exempt from the check, cached per type
+    skip_types = {}
     for op in model.Proto().op:
-        if "NCCL" in op.type or "Copy" in op.type or "Concat" in op.type:
+        op_type = op.type
+        skip = skip_types.get(op_type)
+        if skip is None:
+            skip = "NCCL" in op_type or "Copy" in op_type or \
+                "Concat" in op_type
+            skip_types[op_type] = skip
+        if skip:
             continue
         if "Sum" == op.type and op.name == "dpm":
             continue
@@ -1485,15 +1635,17 @@ def _AnalyzeOperators(model):
         if op_dev.device_type != caffe2_pb2.CUDA:
             continue
 
-        namescope = "{}_{}/".format(model._device_prefix, op_gpu)
-        for inp in list(op.input) + list(op.output):
-            if inp.startswith("{}_".format(model._device_prefix)
-                             ) and not inp.startswith(namescope):
+        namescope = namescopes.get(op_gpu)
+        if namescope is None:
+            namescope = "{}_{}/".format(model._device_prefix, op_gpu)
+            namescopes[op_gpu] = namescope
+        for inp in chain(op.input, op.output):
+            if inp.startswith(device_prefix) and not inp.startswith(namescope):
                 raise Exception(
                     "Blob {} of op {}, should have namescope {}. Op: {}".format(
                         inp,
                         op.type,
-                        "{}_{}/".format(model._device_prefix, op_gpu),
+                        namescope,
                         str(op),
                     )
                 )
@@ -1512,9 +1664,8 @@ def _InferBlobDevice(model):
                 # Hack for Iters which have blob in CPU context
                 device_option = caffe2_pb2.DeviceOption()
                 device_option.device_type = caffe2_pb2.CPU
-            for b in list(op.input) + list(op.output):
-                if b not in mapping:
-                    mapping[b] = device_option
+            for b in chain(op.input, op.output):
+                mapping.setdefault(b, device_option)
             if op.type.startswith('RecurrentNetwork'):
                 step_args = [a for a in op.arg if a.name.endswith("step_net")]
                 for step_arg in step_args:
@@ -1522,17 +1673,21 @@ def _InferBlobDevice(model):
     map_ops(model.param_init_net.Proto())
     map_ops(model.net.Proto())
     model._blob_to_device = mapping
+    model._gpu_blobs = frozenset(
+        b for b, device_option in viewitems(mapping)
+        if device_option.device_type == caffe2_pb2.CUDA
+    )
 
 def _IsGPUBlob(model, blob_name):
     if blob_name in model._blob_to_device:
-        return model._blob_to_device[blob_name].device_type == caffe2_pb2.CUDA
+        return blob_name in model._gpu_blobs
     else:
         blob_name = "{}_{}/{}".format(
             model._device_prefix, model._devices[0], blob_name
         )
         if blob_name not in model._blob_to_device:
             return model._device_type == caffe2_pb2.CUDA
-        return model._blob_to_device[blob_name].device_type == caffe2_pb2.CUDA
+        return blob_name in model._gpu_blobs
 
 
 def _GroupByDevice(model, devices, params, non_data_params):
@@ -1544,23 +1699,29 @@ def _GroupByDevice(model, devices, params, non_data_params):
     # Only consider params that were created to be  "data parallel"
     params = params[len(non_data_params):]
 
-    for _i, p in enumerate(params):
+    def device_id(namescope):
+        return int(namescope.split("_")[1].split("/")[0])
+
+    for p in params:
         assert isinstance(p, core.BlobReference) or \
             isinstance(p, core.GradientSlice), \
             "Param {} is not BlobReference or GradientSlice".format(p)
 
         name = stripBlobName(p)
-        gpuid = None
 
         if isinstance(p, core.BlobReference):
-            gpuid = int(p.GetNameScope().split("_")[1].split("/")[0])
-            assert "{}_{}/".format(model._device_prefix, gpuid) in p.GetNameScope(),\
+            namescope = p.GetNameScope()
+            gpuid = device_id(namescope)
+            device_scope = "{}_{}/".format(model._device_prefix, gpuid)
+            assert device_scope in namescope,\
                 "Param {} expected to have namescope '{}_{}'".format(str(p), model._device_prefix, gpuid)
         else:
-            gpuid = int(p.indices.GetNameScope().split("_")[1].split("/")[0])
-            assert "{}_{}/".format(model._device_prefix, gpuid) in p.indices.GetNameScope(),\
+            namescope = p.indices.GetNameScope()
+            gpuid = device_id(namescope)
+            device_scope = "{}_{}/".format(model._device_prefix, gpuid)
+            assert device_scope in namescope,\
                 "Indices {} expected to have namescope '{}_{}'".format(str(p), model._device_prefix, gpuid)
-            assert "{}_{}/".format(model._device_prefix, gpuid) in p.values.GetNameScope(),\
+            assert device_scope in p.values.GetNameScope(),\
                 "Values {} expected to have namescope '{}_{}'".format(str(p), model._device_prefix, gpuid)
 
         if name not in grouped:
@@ -1573,11 +1734,7 @@ def _GroupByDevice(model, devices, params, non_data_params):
 def _ValidateParams(params):
     set_params = set(params)
     if len(params) > len(set_params):
-        dupes = []
-        sp = sorted(params)
-        for j, p in enumerate(sp):
-            if j > 0 and sp[j - 1] == p:
-                dupes.append(p)
+        dupes = [p for p, count in viewitems(Counter(params)) if count > 1]
 
         assert len(params) == len(set_params), \
             "Duplicate entries in params: {}".format(dupes)
@@ -1596,13 +1753,13 @@ def _ComputeBlobsToSync(model):
         sync_names = [stripBlobName(p) for p in blobs_to_sync]
     else:
         blobs_to_sync = []
+        device_prefix = "{}_".format(model._device_prefix)
+        separator = scope._NAMESCOPE_SEPARATOR
 
         for op in model.param_init_net.Proto().op:
-            dp_outputs = [
-                o for o in op.output
-                if o.startswith("{}_".format(model._device_prefix))
-            ]
-            sync_names.update([stripBlobName(o) for o in dp_outputs])
+            dp_outputs = [o for o in op.output if o.startswith(device_prefix)]
+            # Same as stripBlobName, without the GradientSlice check
+            sync_names.update(o[o.index(separator) + 1:] for o in dp_outputs)
             blobs_to_sync.extend(dp_outputs)
 
         # Sanity check
@@ -1618,23 +1775,23 @@ def _ComputeBlobsToSync(model):
         deviceid = int(b[prefixlen:b.index(scope._NAMESCOPE_SEPARATOR)])
         return (deviceid, b)
 
-    blobs_to_sync = sorted(
-        list(set(blobs_to_sync)),
-        key=extract_sort_key)
-
-    blobs_to_sync = [core.BlobReference(b) for b in blobs_to_sync]
+    blobs_to_sync = [
+        core.BlobReference(b)
+        for b in sorted(set(blobs_to_sync), key=extract_sort_key)
+    ]
     return (blobs_to_sync, sync_names)
 
 
 def _OptimizeGradientMemorySimple(model, losses_by_gpu, devices):
     log.warning("------- DEPRECATED API, please use " +
                    "data_parallel_model.OptimizeGradientMemory() ----- ")
+    param_grads = set(viewvalues(model.param_to_grad))
     for device in devices:
         namescope = "{}_{}/".format(model._device_prefix, device)
         model.net._net = memonger.share_grad_blobs(
             model.net,
             losses_by_gpu[device],
-            set(viewvalues(model.param_to_grad)),
+            param_grads,
             namescope,
             share_activations=False,
         )
@@ -1690,13 +1847,14 @@ def OptimizeGradientMemory(model,
     else:
         shapes = None
 
+    param_grads = set(viewvalues(model.param_to_grad))
     for device in model._devices:
         namescope = "{}_{}/".format(model._device_prefix, device)
         excluded_blobs_by_device = set(namescope + b for b in excluded_blobs)
         model.net._net = memonger.share_grad_blobs(
             model.net,
             model._losses_by_gpu[device],
-            set(viewvalues(model.param_to_grad)),
+            param_grads,
             namescope,
             dont_share_blobs=excluded_blobs_by_device,
             share_activations=recycle_activations,
@@ -17,7 +17,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from future.utils import viewkeys
+from future.utils import viewitems, viewkeys
 from multiprocessing import Process, Queue
 import numpy as np
 import os
@@ -52,7 +52,7 @@ class TemporaryDirectory:
 @unittest.skipIf(os.environ.get("TRAVIS"), "DPMTest has a known issue with Travis.")
 class DataParallelModelTest(TestCase):
 
-    def run_model(self, devices, gpu):
+    def run_model(self, devices, gpu, **parallelize_kwargs):
         '''
         Helper function for test_equiv
         '''
@@ -95,6 +95,7 @@ class DataParallelModelTest(TestCase):
             cpu_device=not gpu,
             shared_model=not gpu,
             combine_spatial_bn=not gpu,
+            **parallelize_kwargs
         )
         data_parallel_model.AddBlobSync(model, ["sync_num"])
 
@@ -208,6 +209,59 @@ class DataParallelModelTest(TestCase):
                 result_16gpus = self.run_model(list(range(16)), gpu=gpu)
                 self.assertTrue(np.allclose(result_1gpus, result_16gpus))
 
+    @unittest.skipIf(not workspace.has_gpu_support, "No gpu support.")
+    @unittest.skipIf(workspace.NumCudaDevices() < 2, "Need at least 2 GPUs.")
+    def test_equiv_allreduce_buckets(self):
+        '''
+        Test that fusing the NCCL allreduces into buckets gives the same
+        gradients and parameters as reducing every blob separately.
+        '''
+        devices = [0, 1]
+        result = self.run_model(devices, gpu=True, use_nccl=True)
+        grad = workspace.FetchBlob("gpu_0/fc_w_grad")
+        # fc has two params: one bucket holding both, and a bucket bigger
+        # than the number of gradients
+        for num_blobs in [2, 3]:
+            result_buckets = self.run_model(
+                devices,
+                gpu=True,
+                use_nccl=True,
+                allreduce_bucket_num_blobs=num_blobs,
+            )
+            for device in devices:
+                grad_buckets = workspace.FetchBlob(
+                    "gpu_{}/fc_w_grad".format(device))
+                self.assertEqual(grad.shape, grad_buckets.shape)
+                self.assertTrue(np.allclose(grad, grad_buckets))
+            self.assertTrue(np.allclose(result, result_buckets))
+
+    @unittest.skipIf(not workspace.has_gpu_support, "No gpu support.")
+    @unittest.skipIf(workspace.NumCudaDevices() < 2, "Need at least 2 GPUs.")
+    def test_equiv_fp16_allreduce(self):
+        '''
+        Test that reducing gradients in half precision stays close to the
+        fp32 NCCL allreduce, with and without buckets.
+        '''
+        devices = [0, 1]
+        result = self.run_model(devices, gpu=True, use_nccl=True)
+        grad = workspace.FetchBlob("gpu_0/fc_w_grad")
+        for num_blobs in [None, 2]:
+            result_fp16 = self.run_model(
+                devices,
+                gpu=True,
+                use_nccl=True,
+                allreduce_bucket_num_blobs=num_blobs,
+                fp16_allreduce=True,
+            )
+            for device in devices:
+                grad_fp16 = workspace.FetchBlob(
+                    "gpu_{}/fc_w_grad".format(device))
+                self.assertEqual(grad_fp16.dtype, np.float32)
+                self.assertTrue(
+                    np.allclose(grad, grad_fp16, rtol=1e-2, atol=1e-3))
+            self.assertTrue(
+                np.allclose(result, result_fp16, rtol=1e-2, atol=1e-3))
+
     def test_checkpoint_params(self):
         def add_input_ops(model):
             pass
@@ -856,6 +910,51 @@ class ParallelizeBMUFTest(TestCase):
         np.testing.assert_equal(w_0, w_g_ + v_w)
         np.testing.assert_equal(b_0, b_g_ + v_b)
 
+    def _run_bmuf_nccl(self, devices, **parallelize_kwargs):
+        workspace.ResetWorkspace()
+        model = cnn.CNNModelHelper(
+            order="NHWC",
+            name="test"
+        )
+
+        def input_builder_fun(model):
+            return None
+
+        self._generate_data(devices, caffe2_pb2.CUDA, "gpu")
+        data_parallel_model.Parallelize_BMUF(
+            model,
+            input_builder_fun,
+            self._model_build_fun,
+            self._param_update_fun,
+            devices=devices,
+            use_nccl=True,
+            **parallelize_kwargs
+        )
+        data_parallel_model.RunInitNet(model)
+        data_parallel_model.RunNet(model, 1)
+        workspace.RunNetOnce(model.net)
+        workspace.RunNetOnce(model._global_model_param_updates_net)
+        blobs = [
+            "gpu_{}/{}".format(device, blob)
+            for device in devices
+            for blob in ["fc_w", "fc_b", "fc_w_v", "fc_b_v"]
+        ]
+        return {blob: workspace.FetchBlob(blob) for blob in blobs}
+
+    @unittest.skipIf(not workspace.has_gpu_support, "No gpu support.")
+    def test_parallelize_bmuf_allreduce_buckets(self):
+        devices = [0, 1]
+        expected = self._run_bmuf_nccl(devices)
+        # fc has two params: one bucket holding both, and a bucket bigger
+        # than the number of params
+        for num_blobs in [2, 3]:
+            result = self._run_bmuf_nccl(
+                devices, allreduce_bucket_num_blobs=num_blobs
+            )
+            for blob, value in viewitems(expected):
+                self.assertEqual(value.shape, result[blob].shape)
+                self.assertTrue(np.allclose(value, result[blob]))
+
 
 @unittest.skipIf(not workspace.has_gpu_support, "No gpu support.")
 @unittest.skipIf(workspace.NumCudaDevices() < 2, "Need at least 2 GPUs.")
@@ -51,7 +51,7 @@ class BatchDistillLRLoss(ModelLayer):
             ),
             input_record
         )
-        self.tags.update([Tags.EXCLUDE_FROM_PREDICTION])
+        self.tags.add(Tags.EXCLUDE_FROM_PREDICTION)
 
         self.output_schema = schema.Scalar(
             np.float32,
@@ -70,7 +70,7 @@ class BatchLRLoss(ModelLayer):
         self.pos_label_target = pos_label_target
         self.neg_label_target = neg_label_target
 
-        self.tags.update([Tags.EXCLUDE_FROM_PREDICTION])
+        self.tags.add(Tags.EXCLUDE_FROM_PREDICTION)
 
         self.output_schema = schema.Scalar(
             np.float32,
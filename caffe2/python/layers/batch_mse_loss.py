@@ -42,7 +42,7 @@ class BatchMSELoss(ModelLayer):
             ),
             input_record
         )
-        self.tags.update([Tags.EXCLUDE_FROM_PREDICTION])
+        self.tags.add(Tags.EXCLUDE_FROM_PREDICTION)
 
         self.output_schema = schema.Scalar(
             np.float32,
@@ -66,11 +66,14 @@ class BatchMSELoss(ModelLayer):
                     self.input_record.prediction.field_type()
                 )
             )
-
-        label = net.StopGradient(
-            label,
-            net.NextScopedBlob('stopped_label')
-        )
+            # The cast label is private to this layer, so stop the gradient
+            # in place instead of copying it
+            label = net.StopGradient(label, label)
+        else:
+            label = net.StopGradient(
+                label,
+                net.NextScopedBlob('stopped_label')
+            )
 
         l2dist = net.SquaredL2Distance(
             [label, prediction],
@@ -48,7 +48,7 @@ class BatchSigmoidCrossEntropyLoss(ModelLayer):
             input_record.label.field_type().shape, \
             "prediction and label must have the same shape"
 
-        self.tags.update([Tags.EXCLUDE_FROM_PREDICTION])
+        self.tags.add(Tags.EXCLUDE_FROM_PREDICTION)
 
         self.output_schema = schema.Scalar(
             (np.float32, tuple()), self.get_next_blob_reference('loss')
@@ -86,7 +86,7 @@ class Concat(ModelLayer):
             assert len(shape) >= axis,\
                 "Concat expects that limited dimensions of the input tensor"
             shapes.append(shape)
-        logger.info('Concat Layer input shapes: ' + str(shapes))
+        logger.info('Concat Layer input shapes: %s', shapes)
 
         if axis == 0:
             self.output_schema = schema.from_blob_list(
@@ -105,7 +105,7 @@ class Concat(ModelLayer):
         output_dims = shapes[0]
         output_dims[axis - 1] = concat_dim
 
-        logger.info('Concat Layer output_dims: ' + str(output_dims))
+        logger.info('Concat Layer output_dims: %s', output_dims)
         self.output_schema = schema.Scalar(
             (np.float32, output_dims),
             self.get_next_blob_reference('output'))
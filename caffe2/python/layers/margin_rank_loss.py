@@ -30,7 +30,7 @@ class MarginRankLoss(ModelLayer):
             ),
             input_record
         )
-        self.tags.update([Tags.EXCLUDE_FROM_PREDICTION])
+        self.tags.add(Tags.EXCLUDE_FROM_PREDICTION)
         self.output_schema = schema.Scalar(
             np.float32,
             self.get_next_blob_reference('output'))
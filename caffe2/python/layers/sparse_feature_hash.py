@@ -42,6 +42,7 @@ class SparseFeatureHash(ModelLayer):
         self.seed = seed
         self.use_hashing = use_hashing
         if schema.equal_schemas(input_record, IdList):
+            self._input_is_id_list = True
             self.modulo = modulo or self.extract_hash_size(input_record.items.metadata)
             metadata = schema.Metadata(
                 categorical_limit=self.modulo,
@@ -53,6 +54,7 @@ class SparseFeatureHash(ModelLayer):
             self.output_schema.items.set_metadata(metadata)
 
         elif schema.equal_schemas(input_record, IdScoreList):
+            self._input_is_id_list = False
             self.modulo = modulo or self.extract_hash_size(input_record.keys.metadata)
             metadata = schema.Metadata(
                 categorical_limit=self.modulo,
@@ -71,7 +73,7 @@ class SparseFeatureHash(ModelLayer):
         # operators in this layer do not have CUDA implementation yet.
         # In addition, since the sparse feature keys that we are hashing are
         # typically on CPU originally, it makes sense to have this layer on CPU.
-        self.tags.update([Tags.CPU_ONLY])
+        self.tags.add(Tags.CPU_ONLY)
 
     def extract_hash_size(self, metadata):
         if metadata.feature_specs and metadata.feature_specs.desired_hash_size:
@@ -86,18 +88,16 @@ class SparseFeatureHash(ModelLayer):
             self.input_record.lengths(),
             self.output_schema.lengths()
         )
-        if schema.equal_schemas(self.output_schema, IdList):
+        if self._input_is_id_list:
             input_blob = self.input_record.items()
             output_blob = self.output_schema.items()
-        elif schema.equal_schemas(self.output_schema, IdScoreList):
+        else:
             input_blob = self.input_record.keys()
             output_blob = self.output_schema.keys()
             net.Copy(
                 self.input_record.values(),
                 self.output_schema.values()
             )
-        else:
-            raise NotImplementedError()
 
         if self.use_hashing:
             net.IndexHash(
@@ -37,12 +37,26 @@ import numpy as np
 import operator
 
 
+# Parameter groups returned by SparseLookup.get_8bits_compatible_parameters,
+# for the fused (scale and bias stored inline) and non-fused 8-bit formats.
+_FusedRowwiseQuantized8BitsWeight = collections.namedtuple(
+    'RowwiseQuantized8BitsWeight', 'w'
+)
+_RowwiseQuantized8BitsWeight = collections.namedtuple(
+    'RowwiseQuantized8BitsWeight', 'w, scale_bias'
+)
+
+
 def get_sparse_lookup_predictor_version(version):
     assert version in {'fp32', 'fp16', 'uint8rowwise', 'fused_uint8rowwise'},\
         "Unexpected version of sparse_lookup layer {0}".format(version)
     return version
 
 
+_PREDICTOR_VERSION_SCOPE_KEY = get_sparse_lookup_predictor_version.__name__
+_DEFAULT_PREDICTOR_VERSION = {'version': 'fp32'}
+
+
 def _is_id_list(input_record):
     return schema.equal_schemas(input_record, IdList)
 
@@ -92,9 +106,13 @@ class SparseLookup(ModelLayer):
         self.weight_init = weight_init if weight_init else (
             'UniformFill', {'min': -scale, 'max': scale})
 
+        # The input type is fixed for the layer's lifetime, so the schema
+        # comparison is done once here rather than in every add_ops
         if _is_id_list(self.input_record):
+            self._input_is_id_list = True
             sparse_key = self.input_record.items()
         elif _is_id_score_list(self.input_record):
+            self._input_is_id_list = False
             sparse_key = self.input_record.keys()
         else:
             raise NotImplementedError()
@@ -146,15 +164,9 @@ class SparseLookup(ModelLayer):
         if not self.support_8bit():
             return []
         if fused:
-            RowwiseQuantized8BitsWeight = collections.namedtuple(
-                'RowwiseQuantized8BitsWeight', 'w'
-            )
-            return [RowwiseQuantized8BitsWeight(self.w)]
+            return [_FusedRowwiseQuantized8BitsWeight(self.w)]
         else:
-            RowwiseQuantized8BitsWeight = collections.namedtuple(
-                'RowwiseQuantized8BitsWeight', 'w, scale_bias'
-            )
-            return [RowwiseQuantized8BitsWeight(self.w, self.scale_bias)]
+            return [_RowwiseQuantized8BitsWeight(self.w, self.scale_bias)]
 
     def _gather_wrapper(self, net, version, in_indices, out):
         # Gather can work on all kinds of input data types, and output
@@ -163,20 +175,23 @@ class SparseLookup(ModelLayer):
         if version == 'fp32':
             return net.Gather([self.w, in_indices], out)
         elif version == 'fp16':
-            gathered_w = net.Gather([self.w, in_indices], 'gathered_w')
+            gathered_w = net.Gather(
+                [self.w, in_indices], net.NextScopedBlob('gathered_w'))
 
             return net.HalfToFloat(gathered_w, out)
         elif version == 'uint8rowwise':
-            gathered_w = net.Gather([self.w, in_indices], 'gathered_w')
+            gathered_w = net.Gather(
+                [self.w, in_indices], net.NextScopedBlob('gathered_w'))
             gathered_scale_bias = net.Gather(
                 [self.scale_bias, in_indices],
-                'gathered_scale_bias'
+                net.NextScopedBlob('gathered_scale_bias')
             )
 
             return net.Rowwise8BitQuantizedToFloat(
                 [gathered_w, gathered_scale_bias], out)
         elif version == 'fused_uint8rowwise':
-            gathered_w = net.Gather([self.w, in_indices], 'gathered_w')
+            gathered_w = net.Gather(
+                [self.w, in_indices], net.NextScopedBlob('gathered_w'))
             return net.Fused8BitRowwiseQuantizedToFloat(gathered_w, out)
         else:
             raise "Unsupported version of operators in SparseLookup " +\
@@ -268,7 +283,8 @@ class SparseLookup(ModelLayer):
 
         else:
             table_rows = self._gather_wrapper(
-                net, version, self.input_record.items(), 'table_rows')
+                net, version, self.input_record.items(),
+                net.NextScopedBlob('table_rows'))
 
             segment_ids = net.LengthsToSegmentIds(
                 self.input_record.lengths(),
@@ -328,9 +344,11 @@ class SparseLookup(ModelLayer):
 
     def add_ops(self, net):
         cur_scope = get_current_scope()
+        # The version is read from the arg scope active when the ops are
+        # added (e.g. while exporting a predictor), so it can't be cached
         version = get_sparse_lookup_predictor_version(
-            **cur_scope.get(get_sparse_lookup_predictor_version.__name__,
-                            {'version': 'fp32'}))
+            **cur_scope.get(_PREDICTOR_VERSION_SCOPE_KEY,
+                            _DEFAULT_PREDICTOR_VERSION))
 
         # TODO(amalevich): Layer should not be responsible for decision about
         # quantization.
@@ -338,9 +356,7 @@ class SparseLookup(ModelLayer):
                                                    'fused_uint8rowwise'}:
             version = 'fp32'
 
-        if _is_id_list(self.input_record):
+        if self._input_is_id_list:
             self._add_ops_id_list(net, version=version)
-        elif _is_id_score_list(self.input_record):
-            self._add_ops_id_score_list(net, version=version)
         else:
-            raise "Unsupported input type {0}".format(self.input_record)
+            self._add_ops_id_score_list(net, version=version)
@@ -60,13 +60,6 @@ def share_grad_blobs(
         return name.endswith("_grad") and (name.startswith(namescope) or
             name.startswith("_" + namescope)) and name not in param_grads
 
-    def is_grad_op(op):
-        # TODO: something smarter
-        for b in list(op.input) + list(op.output):
-            if is_grad_blob(b):
-                return True
-        return False
-
     log.warn("NOTE: Executing memonger to optimize gradient memory")
 
     # Collect ops that have something to do with gradients
@@ -86,17 +79,20 @@ def share_grad_blobs(
     # Remove last activations, as they are usually accessed externally
     activations = set(activations[:-2])
 
-    # Gradient ops
+    # Gradient ops and the blobs that may be shared, in a single pass
     grad_op_indices = []
-    for idx, op in enumerate(netproto.op):
-        if (is_grad_op(op)):
-            grad_op_indices.append(idx)
-
     shared_blobs = set()
-    for op in net.Proto().op:
+    for idx, op in enumerate(netproto.op):
+        # TODO: something smarter
+        is_grad_op = False
         for b in list(op.input) + list(op.output):
-            if is_grad_blob(b) or (share_activations and b in activations):
+            if is_grad_blob(b):
+                is_grad_op = True
+                shared_blobs.add(b)
+            elif share_activations and b in activations:
                 shared_blobs.add(b)
+        if is_grad_op:
+            grad_op_indices.append(idx)
     start_time = time.time()
     optim_str = C.memonger_compute_blob_recycling_for_dag(
         netproto.SerializeToString(),
@@ -24,6 +24,30 @@ import hypothesis.strategies as st
 import numpy as np
 
 
+def _index_hash(indices, seed, modulo):
+    dtype = np.array(indices).dtype
+    assert dtype == np.int32 or dtype == np.int64
+    hashed_indices = []
+    for index in indices:
+        hashed = dtype.type(0xDEADBEEF * seed)
+        indices_bytes = np.array([index], dtype).view(np.int8)
+        for b in indices_bytes:
+            hashed = dtype.type(hashed * 65537 + b)
+        hashed = (modulo + hashed % modulo) % modulo
+        hashed_indices.append(hashed)
+    return [hashed_indices]
+
+
+def _signed_indices(dtype):
+    info = np.iinfo(dtype)
+    return hu.tensor(
+        min_dim=1,
+        max_dim=1,
+        dtype=dtype,
+        elements=st.integers(min_value=info.min, max_value=info.max),
+    )
+
+
 class TestIndexHashOps(hu.HypothesisTestCase):
     @given(
         indices=st.sampled_from([
@@ -39,17 +63,30 @@ class TestIndexHashOps(hu.HypothesisTestCase):
                                  seed=seed, modulo=modulo)
 
         def index_hash(indices):
-            dtype = np.array(indices).dtype
-            assert dtype == np.int32 or dtype == np.int64
-            hashed_indices = []
-            for index in indices:
-                hashed = dtype.type(0xDEADBEEF * seed)
-                indices_bytes = np.array([index], dtype).view(np.int8)
-                for b in indices_bytes:
-                    hashed = dtype.type(hashed * 65537 + b)
-                hashed = (modulo + hashed % modulo) % modulo
-                hashed_indices.append(hashed)
-            return [hashed_indices]
+            return _index_hash(indices, seed, modulo)
+
+        self.assertDeviceChecks(dc, op, [indices], [0])
+        self.assertReferenceChecks(gc, op, [indices], index_hash)
+
+    @given(
+        indices=st.sampled_from([np.int32, np.int64]).flatmap(_signed_indices),
+        seed=st.integers(min_value=0, max_value=10),
+        modulo=st.one_of(
+            st.sampled_from([1, 2]),
+            st.integers(min_value=2, max_value=30).map(lambda k: 2 ** k),
+        ),
+        **hu.gcs_cpu_only
+    )
+    def test_index_hash_ops_power_of_two_modulo(
+            self, indices, seed, modulo, gc, dc):
+        # Power of two modulos take the bit mask path in the operator, which
+        # has to match the remainder based reference, for negative ids too.
+        op = core.CreateOperator("IndexHash",
+                                 ["indices"], ["hashed_indices"],
+                                 seed=seed, modulo=modulo)
+
+        def index_hash(indices):
+            return _index_hash(indices, seed, modulo)
 
         self.assertDeviceChecks(dc, op, [indices], [0])
         self.assertReferenceChecks(gc, op, [indices], index_hash)
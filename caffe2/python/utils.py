@@ -31,14 +31,16 @@ from six import integer_types, binary_type, text_type
 
 
 def CaffeBlobToNumpyArray(blob):
+    # blob.data is a protobuf repeated field rather than a list, so
+    # np.asarray would have to probe it as a generic sequence first. fromiter
+    # with a known count fills a preallocated buffer in a single pass.
+    data = np.fromiter(blob.data, dtype=np.float32, count=len(blob.data))
     if (blob.num != 0):
         # old style caffe blob.
-        return (np.asarray(blob.data, dtype=np.float32)
-                .reshape(blob.num, blob.channels, blob.height, blob.width))
+        return data.reshape(blob.num, blob.channels, blob.height, blob.width)
     else:
         # new style caffe blob.
-        return (np.asarray(blob.data, dtype=np.float32)
-                .reshape(blob.shape.dim))
+        return data.reshape(blob.shape.dim)
 
 
 def Caffe2TensorToNumpyArray(tensor):
@@ -76,25 +78,25 @@ def NumpyArrayToCaffe2Tensor(arr, name=None):
         tensor.name = name
     if arr.dtype == np.float32:
         tensor.data_type = caffe2_pb2.TensorProto.FLOAT
-        tensor.float_data.extend(list(arr.flatten().astype(float)))
+        tensor.float_data.extend(arr.ravel().tolist())
     elif arr.dtype == np.float64:
         tensor.data_type = caffe2_pb2.TensorProto.DOUBLE
-        tensor.double_data.extend(list(arr.flatten().astype(np.float64)))
+        tensor.double_data.extend(arr.ravel().tolist())
     elif arr.dtype == np.int or arr.dtype == np.int32:
         tensor.data_type = caffe2_pb2.TensorProto.INT32
         tensor.int32_data.extend(arr.flatten().astype(np.int).tolist())
     elif arr.dtype == np.int16:
         tensor.data_type = caffe2_pb2.TensorProto.INT16
-        tensor.int32_data.extend(list(arr.flatten().astype(np.int16)))  # np.int16=>pb.INT16 use int32_data
+        tensor.int32_data.extend(arr.ravel().tolist())  # np.int16=>pb.INT16 use int32_data
     elif arr.dtype == np.uint16:
         tensor.data_type = caffe2_pb2.TensorProto.UINT16
-        tensor.int32_data.extend(list(arr.flatten().astype(np.uint16)))  # np.uint16=>pb.UNIT16 use int32_data
+        tensor.int32_data.extend(arr.ravel().tolist())  # np.uint16=>pb.UNIT16 use int32_data
     elif arr.dtype == np.int8:
         tensor.data_type = caffe2_pb2.TensorProto.INT8
-        tensor.int32_data.extend(list(arr.flatten().astype(np.int8)))   # np.int8=>pb.INT8 use int32_data
+        tensor.int32_data.extend(arr.ravel().tolist())  # np.int8=>pb.INT8 use int32_data
     elif arr.dtype == np.uint8:
         tensor.data_type = caffe2_pb2.TensorProto.UINT8
-        tensor.int32_data.extend(list(arr.flatten().astype(np.uint8)))   # np.uint8=>pb.UNIT8 use int32_data
+        tensor.int32_data.extend(arr.ravel().tolist())  # np.uint8=>pb.UNIT8 use int32_data
     else:
         # TODO: complete the data type: bool, float16, byte, int64, string
         raise RuntimeError(